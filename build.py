@@ -0,0 +1,40 @@
+"""
+Builds the optional Cython extension of nexcsi,
+nexcsi/_walk.pyx, when the package is installed.
+
+Cython is a build requirement in pyproject.toml,
+so it is always available here. nexcsi works
+without the extension, so if a C compiler is
+missing, it is skipped instead of failing the install.
+"""
+
+from Cython.Build import cythonize
+from setuptools.command.build_ext import build_ext
+
+
+class OptionalBuildExt(build_ext):
+    """
+    build_ext that warns instead of
+    failing when an extension can't be built.
+    """
+
+    def run(self):
+        try:
+            super().run()
+        except Exception as e:
+            print(f"Skipping the optional nexcsi C extension: {e}")
+
+    def build_extension(self, ext):
+        try:
+            super().build_extension(ext)
+        except Exception as e:
+            print(f"Skipping the optional nexcsi C extension {ext.name}: {e}")
+
+
+def build(setup_kwargs):
+    setup_kwargs.update(
+        {
+            "ext_modules": cythonize(["nexcsi/_walk.pyx"]),
+            "cmdclass": {"build_ext": OptionalBuildExt},
+        }
+    )
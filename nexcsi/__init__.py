@@ -1,5 +1,12 @@
+import numpy as np
+
 from nexcsi._decoder import decoder
 
+# Numpy has no complex32, so unpack(..., dtype="complex32")
+# returns pairs of float16s. Half the size of complex64,
+# at the cost of precision.
+complex32 = np.dtype([("real", np.float16), ("imag", np.float16)])
+
 # Indexes of Null and Pilot OFDM subcarriers
 # https://www.oreilly.com/library/view/80211ac-a-survival/9781449357702/ch02.html
 nulls = {
@@ -1,24 +1,41 @@
 from functools import partial
+from importlib import import_module
 
 raspberrypi = ["raspberrypi", "rpi", "rpi4", "rpi3", "bcm43455c0", "bcm43455", "Raspberry Pi B3+/B4"]
 nexus5 = ["nexus5", "bcm4339", "Nexus 5"]
 nexus6p = ["nexus6p", "bcm4358", "Nexus 6P"]
 rtac86u = ["rtac86u", "bcm4366c0", "Asus RT-AC86U"]
 
+# Every name of a device, mapped to the
+# module that decodes its CSI format, and
+# to the canonical name of the device.
+__devices = {
+    name: (module, names[0])
+    for module, devices in (
+        ("interleaved", (raspberrypi, nexus5)),
+        ("floating", (nexus6p, rtac86u)),
+    )
+    for names in devices
+    for name in names
+}
+
 
 def decoder(device):
-    if device in raspberrypi + nexus5:
-        from nexcsi import interleaved
-        interleaved.unpack = partial(interleaved.unpack, device=device)
-        return interleaved
-    elif device in nexus6p + rtac86u:
-        from nexcsi import floating
-        floating.unpack = partial(floating.unpack, device=device)
-        return floating
-    else:
+    try:
+        module, device = __devices[device]
+    except KeyError:
         raise ValueError(
             f"Device '{device}' seems to be an unsupported format. " +
             "Please create a new issue at " +
             "https://github.com/nexmonster/nexcsi/issues " +
             "if you think this is an bug."
-        )
\ No newline at end of file
+        ) from None
+
+    module = import_module(f"nexcsi.{module}")
+
+    # Unwrap the partial of a previous call,
+    # so that partials don't nest on every call.
+    unpack = getattr(module.unpack, "func", module.unpack)
+    module.unpack = partial(unpack, device=device)
+
+    return module
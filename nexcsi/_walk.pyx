@@ -0,0 +1,73 @@
+# cython: language_level=3
+"""
+Cython version of the pcap walk in _fastread,
+used when Numba isn't installed.
+
+Built at install time if a C compiler
+is available, see build.py.
+"""
+
+cimport cython
+from libc.stdint cimport uint32_t
+from libc.string cimport memcpy
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def walk(
+    const unsigned char[::1] fc,
+    unsigned char[::1] out,
+    Py_ssize_t ptr,
+    Py_ssize_t stop,
+    Py_ssize_t nsamples,
+    Py_ssize_t pcap_filesize,
+    Py_ssize_t nbytes_sample,
+):
+    """
+    Same as _fastread.__walk_python, with
+    the loop in C and without the GIL.
+    """
+
+    cdef Py_ssize_t nsamples_max = out.shape[0] // nbytes_sample
+    cdef Py_ssize_t data_index = nsamples * nbytes_sample
+    cdef uint32_t frame_len
+
+    # The loop reads fc without bounds checks
+    pcap_filesize = min(pcap_filesize, fc.shape[0])
+
+    if nsamples_max == 0 or fc.shape[0] == 0:
+        return ptr, nsamples
+
+    cdef const unsigned char* fc_ptr = &fc[0]
+    cdef unsigned char* out_ptr = &out[0]
+
+    with nogil:
+        while (
+            ptr < stop
+            and ptr + nbytes_sample + 38 <= pcap_filesize
+            and nsamples < nsamples_max
+        ):
+
+            # incl_len of the packet header, little endian
+            frame_len = (
+                fc_ptr[ptr + 8]
+                | <uint32_t>fc_ptr[ptr + 9] << 8
+                | <uint32_t>fc_ptr[ptr + 10] << 16
+                | <uint32_t>fc_ptr[ptr + 11] << 24
+            )
+
+            # Read Timestamps
+            memcpy(out_ptr + data_index, fc_ptr + ptr, 8)
+
+            # Read saddr, daddr, sport, dport
+            memcpy(out_ptr + data_index + 8, fc_ptr + ptr + 42, 12)
+
+            ptr += 58  # Skip over Header, Eth, IP, UDP
+
+            memcpy(out_ptr + data_index + 20, fc_ptr + ptr, nbytes_sample - 20)
+
+            nsamples += 1
+            ptr += <Py_ssize_t>frame_len - 42
+            data_index += nbytes_sample
+
+    return ptr, nsamples
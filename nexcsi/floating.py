@@ -9,7 +9,9 @@ Interleaved CSI samples in PCAP files.
 
 Suitable for bcm4358 and bcm4366c0 chips.
 
-Requires Numpy.
+Requires Numpy. Uses Numba, if it is
+installed, to read pcap files and to
+unpack CSI faster.
 
 Usage
 -----
@@ -22,14 +24,29 @@ Bandwidth is inferred from the pcap file, but
 can also be explicitly set:
 
 samples = floating.read_pcap('path_to_pcap_file', bandwidth=40)
+
+Many pcap files can be read in parallel:
+
+for samples in floating.read_pcaps(['a.pcap', 'b.pcap'], workers=4):
+    ...
 """
 
-__all__ = ["read_pcap", "unpack"]
+__all__ = ["read_pcap", "read_pcaps", "unpack"]
 
 import os
+import threading
 import numpy as np
+from functools import lru_cache
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from nexcsi._decoder import nexus6p, rtac86u
-from nexcsi import nulls, pilots
+from nexcsi import nulls, pilots, complex32
+from nexcsi import _fastread
+
+try:
+    from numba import njit, prange, threading_layer
+except ImportError:  # Numba is optional
+    njit = None
 
 
 def __find_bandwidth(incl_len):
@@ -87,7 +104,42 @@ def __find_nsamples_max(pcap_filesize, nsub):
     return nsamples_max
 
 
-def read_pcap(pcap_filepath, bandwidth=None, nsamples_max=None):
+@lru_cache(maxsize=8)
+def __make_dtype_sample(bandwidth):
+    """
+    Returns the Numpy dtype of a sample,
+    without metadata.
+
+    Building a structured dtype is slow
+    compared to reading a small pcap file,
+    so dtypes are cached by bandwidth.
+    """
+
+    # Number of OFDM sub-carriers
+    nsub = int(bandwidth * 3.2)
+
+    return np.dtype(
+        [
+            ("ts_sec",  np.uint32),
+            ("ts_usec", np.uint32),
+            ("saddr", np.dtype(np.uint32).newbyteorder('>')),
+            ("daddr", np.dtype(np.uint32).newbyteorder('>')),
+            ("sport", np.dtype(np.uint16).newbyteorder('>')),
+            ("dport", np.dtype(np.uint16).newbyteorder('>')),
+            ("magic", np.uint16),
+            ("rssi", np.int8),
+            ("fctl", np.uint8),
+            ("mac", np.uint8, 6),
+            ("seq", np.uint16),
+            ("css", np.uint16),
+            ("csp", np.uint16),
+            ("cvr", np.uint16),
+            ("csi", np.uint32, nsub),
+        ]
+    )
+
+
+def read_pcap(pcap_filepath, bandwidth=None, nsamples_max=None, copy=True):
     """
     Reads CSI samples from
     a pcap file. A Numpy
@@ -96,12 +148,18 @@ def read_pcap(pcap_filepath, bandwidth=None, nsamples_max=None):
     Bandwidth and maximum samples
     are inferred from the pcap file by
     default, but you can also set them explicitly.
+
+    If copy is False and all packets in the
+    file have the same length, a read-only view
+    of the memory-mapped file is returned instead,
+    without copying any samples. Its fields are
+    the same, but they are not packed together.
     """
 
     pcap_filesize = os.stat(pcap_filepath).st_size
 
     with open(pcap_filepath, "rb") as pcapfile:
-        fc = pcapfile.read()  # ~2.68 s
+        fc = _fastread.map_pcap(pcapfile)
 
     if bandwidth is None:
         bandwidth = __find_bandwidth(
@@ -115,28 +173,17 @@ def read_pcap(pcap_filepath, bandwidth=None, nsamples_max=None):
     # Number of OFDM sub-carriers
     nsub = int(bandwidth * 3.2)
 
+    # The estimate of nsamples_max is too low if some
+    # packets are shorter than a CSI packet, so the
+    # output grows if it fills up before the end.
+    grow = nsamples_max is None
+
     if nsamples_max is None:
         nsamples_max = __find_nsamples_max(pcap_filesize, nsub)
 
     # Numpy dtype for sample: https://numpy.org/doc/stable/reference/arrays.dtypes.html
     dtype_sample = np.dtype(
-        [
-            ("ts_sec",  np.uint32),
-            ("ts_usec", np.uint32),
-            ("saddr", np.dtype(np.uint32).newbyteorder('>')),
-            ("daddr", np.dtype(np.uint32).newbyteorder('>')),
-            ("sport", np.dtype(np.uint16).newbyteorder('>')),
-            ("dport", np.dtype(np.uint16).newbyteorder('>')),
-            ("magic", np.uint16),
-            ("rssi", np.int8),
-            ("fctl", np.uint8),
-            ("mac", np.uint8, 6),
-            ("seq", np.uint16),
-            ("css", np.uint16),
-            ("csp", np.uint16),
-            ("cvr", np.uint16),
-            ("csi", np.uint32, nsub),
-        ],
+        __make_dtype_sample(bandwidth),
         # This wont be preserved during all array operations.
         # Be very cautious if you're accessing these values
         metadata={
@@ -147,51 +194,210 @@ def read_pcap(pcap_filepath, bandwidth=None, nsamples_max=None):
         }
     )
 
+    if not copy:
+        samples = _fastread.overlay(fc, dtype_sample)
+
+        if samples is not None:
+            return samples[:nsamples_max]
+
     # Number of bytes in a sample
     nbytes_sample = dtype_sample.itemsize
 
     # Pre-allocating memory to contain all samples
-    data = bytearray(nsamples_max * nbytes_sample)  # ~ 1.5s
+    samples = np.empty(nsamples_max, dtype=dtype_sample)
 
-    # This is to track our current position in the bytearray `data`
-    data_index = 0
+    data, nsamples = _fastread.walk(
+        fc, samples.view(np.uint8), nbytes_sample, grow=grow
+    )
 
-    # Pointer to current location in file.
-    # This is faster than using file.tell()
-    # =24 to skip pcap global header
-    ptr = 24
+    # data is a larger copy of samples if it grew
+    samples = data.view(dtype_sample)
 
-    nsamples = 0
-    while ptr < pcap_filesize:
+    return samples[:nsamples]
 
-        frame_len = int.from_bytes(  # ~ 3 s
-            fc[ptr + 8: ptr + 12], byteorder="little", signed=False
-        )
 
-        # Read Timestamps
-        data[data_index: data_index + 8] = fc[ptr: ptr + 8]
+def read_pcaps(pcap_filepaths, workers=None, **kwargs):
+    """
+    Reads CSI samples from many pcap
+    files in parallel threads, and yields
+    a Numpy Structured Array per file,
+    in the order of pcap_filepaths.
+
+    The walk over packets releases the GIL,
+    so files are read concurrently. Other
+    keyword arguments are passed to read_pcap.
+
+    At most `workers` files (os.cpu_count()
+    by default) are read ahead of the file
+    being yielded, so memory stays bounded.
+    """
 
-        # Read saddr, daddr, sport, dport
-        data[data_index + 8: data_index + 20] = fc[ptr + 42: ptr + 54]
+    if workers is None:
+        workers = os.cpu_count() or 1
 
-        ptr += 58  # Skip over Header, Eth, IP, UDP
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = deque()
 
-        data[data_index + 20: data_index + nbytes_sample] = fc[
-            ptr: ptr + nbytes_sample - 20
-        ]  # ~ 5.2 s
+        for pcap_filepath in pcap_filepaths:
+            futures.append(executor.submit(read_pcap, pcap_filepath, **kwargs))
 
-        nsamples += 1
-        ptr += frame_len - 42
-        data_index += nbytes_sample
+            if len(futures) == workers:
+                yield futures.popleft().result()
 
-    samples = np.frombuffer(
-        data[:data_index], dtype=dtype_sample, count=nsamples
-    )  # ~ 1.8 s
+        while futures:
+            yield futures.popleft().result()
 
-    return samples
 
+@lru_cache(maxsize=8)
+def __subcarrier_order(nsub, fftshift):
+    """
+    Returns indexes of subcarriers in the
+    order they are unpacked: fftshifted if
+    fftshift is set, unchanged otherwise.
 
-def unpack(csi, device, fftshift=True, zero_nulls=False, zero_pilots=False):
+    Cached by number of subcarriers, so
+    fftshift is a single take() per call.
+    """
+
+    order = np.arange(nsub)
+
+    if fftshift:
+        order = np.fft.fftshift(order)
+
+    order.flags.writeable = False
+
+    return order
+
+
+def __unpack_numpy(csi, nman, nexp):
+    """
+    Unpacks floating point CSI values
+    with vectorized Numpy operations.
+    """
+
+    # Only copies if csi isn't contiguous, or
+    # isn't native uint32 (e.g. int64 or '>u4')
+    csi_flat = csi.reshape(-1).astype(np.uint32, copy=False)
+
+    mask_iq = (1 << (nman - 1)) - 1
+    mask_ex = (1 << (nexp - 1)) - 1
+
+    mask_sign_i = (1 << (nexp + 2 * nman - 1))
+    mask_sign_q = (1 << (nexp + 1 * nman - 1))
+    # mask_sign_e = (1 << (nexp + 0 * nman - 1))
+
+    # print(np.binary_repr(mask_sign_i, width=32))
+    # print(np.binary_repr(mask_iq << nexp + nman, width=32))
+    # print(np.binary_repr(mask_sign_q, width=32))
+    # print(np.binary_repr(mask_iq << nexp, width=32))
+    # print(np.binary_repr(mask_sign_e, width=32))
+    # print(np.binary_repr(mask_ex, width=32))
+
+    # I, Q and E are at most 11 bits wide, so they stay
+    # 32 bits wide (viewed as signed) instead of int64
+    value_i = np.bitwise_and(np.right_shift(csi_flat, nexp + nman), mask_iq).view(np.int32)
+    value_q = np.bitwise_and(np.right_shift(csi_flat, nexp), mask_iq).view(np.int32)
+    value_e = np.bitwise_and(csi_flat, mask_ex).view(np.int32)
+
+    sign_i = np.bitwise_and(csi_flat, mask_sign_i) != 0
+    sign_q = np.bitwise_and(csi_flat, mask_sign_q) != 0
+    # sign_e = np.bitwise_and(csi_flat, mask_sign_e) != 0
+
+    # Values are sign-magnitude. np.where applies the
+    # sign in one pass, without a masked scatter.
+    value_i = np.where(sign_i, -value_i, value_i)
+    value_q = np.where(sign_q, -value_q, value_q)
+
+    value_e += 10
+
+    # Scaling by 2 ** value_e overflows 32 bit integers,
+    # so I and Q are scaled with ldexp as float32, straight
+    # into the interleaved float32 view of the output.
+    unpacked = np.empty(csi.shape, dtype=np.complex64)
+    unpacked_iq = unpacked.view(np.float32).reshape(-1, 2)
+
+    ldexp_f32 = (np.float32, np.int32, np.float32)
+    np.ldexp(value_i, value_e, out=unpacked_iq[:, 0], signature=ldexp_f32)
+    np.ldexp(value_q, value_e, out=unpacked_iq[:, 1], signature=ldexp_f32)
+
+    return unpacked
+
+
+def __make_unpack_numba(nman, nexp):
+    """
+    Returns a version of __unpack_numpy fused
+    into a single pass over `csi`, that Numba
+    compiles and runs in parallel over samples.
+
+    The kernel is specialized for one floating
+    point format: nman and nexp are closed over,
+    so Numba compiles masks and shifts in as
+    constants.
+    """
+
+    mask_iq = (1 << (nman - 1)) - 1
+    mask_ex = (1 << (nexp - 1)) - 1
+
+    mask_sign_i = (1 << (nexp + 2 * nman - 1))
+    mask_sign_q = (1 << (nexp + 1 * nman - 1))
+
+    def unpack_numba(csi, out, order):
+        """
+        `csi` is a 2D array of samples, `out` is
+        the float32 view of the complex64 output,
+        and subcarrier `sub` of `out` is unpacked
+        from subcarrier `order[sub]` of `csi`.
+        """
+
+        for sample in prange(csi.shape[0]):
+            for sub in range(csi.shape[1]):
+                value = np.int64(csi[sample, order[sub]])
+
+                value_i = (value >> (nexp + nman)) & mask_iq
+                value_q = (value >> nexp) & mask_iq
+                value_e = np.int64(1) << ((value & mask_ex) + 10)
+
+                if value & mask_sign_i:
+                    value_i = -value_i
+
+                if value & mask_sign_q:
+                    value_q = -value_q
+
+                out[sample, 2 * sub] = np.float32(value_i * value_e)
+                out[sample, 2 * sub + 1] = np.float32(value_q * value_e)
+
+    return njit(parallel=True, fastmath=True, cache=True, nogil=True)(unpack_numba)
+
+
+if njit is not None:
+    # A kernel for each (nman, nexp) format in unpack
+    __unpack_numba = {
+        (nman, nexp): __make_unpack_numba(nman, nexp)
+        for nman, nexp in ((12, 6), (9, 5))
+    }
+
+# The workqueue threading layer of Numba aborts
+# the process if parallel kernels are launched
+# from many threads at once, so launches are
+# serialized unless a thread-safe layer is used.
+__unpack_numba_lock = threading.Lock()
+
+
+def __unpack_numba_threadsafe():
+    """
+    Returns True if parallel Numba kernels can
+    be launched from many threads at once.
+    """
+
+    try:
+        return threading_layer() != "workqueue"
+    except ValueError:
+        # No parallel kernel has run yet, so
+        # the threading layer isn't chosen yet
+        return False
+
+
+def unpack(csi, device, fftshift=True, zero_nulls=False, zero_pilots=False, dtype=np.complex64):
     """
     Convert CSI samples from raw,
     in-packet format to Complex64s
@@ -203,7 +409,25 @@ def unpack(csi, device, fftshift=True, zero_nulls=False, zero_pilots=False):
     Set fftshift to False for some
     speedup if you don't care about the
     order of subcarriers.
+
+    Only np.complex64 is supported. Values
+    are scaled by at least 2 ** 10, so most
+    of them don't fit in float16 complex32s.
     """
+    if isinstance(dtype, str) and dtype == "complex32":
+        dtype = complex32
+
+    dtype = np.dtype(dtype)
+
+    if dtype == complex32:
+        raise ValueError(
+            "complex32 isn't supported for floating point CSI, " +
+            "most values are out of the range of float16."
+        )
+
+    if dtype != np.complex64:
+        raise ValueError("dtype should be np.complex64.")
+
     if device in rtac86u:
         nman = 12
         nexp = 6
@@ -218,46 +442,43 @@ def unpack(csi, device, fftshift=True, zero_nulls=False, zero_pilots=False):
             "if you think this is an bug."
         )
 
-    csi_flat = csi.flatten()
-
-    mask_iq = (1 << (nman - 1)) - 1
-    mask_ex = (1 << (nexp - 1)) - 1
-
-    mask_sign_i = (1 << (nexp + 2 * nman - 1))
-    mask_sign_q = (1 << (nexp + 1 * nman - 1))
-    # mask_sign_e = (1 << (nexp + 0 * nman - 1))
-
-    # print(np.binary_repr(mask_sign_i, width=32))
-    # print(np.binary_repr(mask_iq << nexp + nman, width=32))
-    # print(np.binary_repr(mask_sign_q, width=32))
-    # print(np.binary_repr(mask_iq << nexp, width=32))
-    # print(np.binary_repr(mask_sign_e, width=32))
-    # print(np.binary_repr(mask_ex, width=32))
+    if (zero_nulls or zero_pilots) and not fftshift:
+        import warnings
+        warnings.warn("FFTshift is automatically enabled when dropping pilots or nulls. Set fftshift to True to silence this warning.")
+        fftshift = True
 
-    value_i = np.bitwise_and(csi_flat, mask_iq << nexp + nman).astype(np.int64)
-    value_q = np.bitwise_and(csi_flat, mask_iq << nexp).astype(np.int64)
-    value_e = np.bitwise_and(csi_flat, mask_ex).astype(np.int64)
+    # Number of OFDM sub-carriers
+    nsub = csi.shape[-1]
 
-    value_i = np.right_shift(value_i, nexp + nman)
-    value_q = np.right_shift(value_q, nexp)
+    if njit is not None:
+        # The kernel is compiled for native integers.
+        # Only copies if csi isn't native uint32.
+        csi = csi.astype(np.uint32, copy=False)
 
-    sign_i = np.bitwise_and(csi_flat, mask_sign_i).astype(np.int64)
-    sign_q = np.bitwise_and(csi_flat, mask_sign_q).astype(np.int64)
-    # sign_e = np.bitwise_and(csi_flat, mask_sign_e).astype(np.int64)
+        unpacked = np.empty(csi.shape, dtype=np.complex64)
 
-    value_i[sign_i != 0] *= -1
-    value_q[sign_q != 0] *= -1
+        kernel_args = (
+            csi.reshape(-1, nsub),
+            unpacked.view(np.float32).reshape(-1, 2 * nsub),
+            # fftshift is fused into the kernel
+            __subcarrier_order(nsub, fftshift),
+        )
 
-    value_e += 10
-    value_e = np.power(2, value_e)
+        kernel = __unpack_numba[(nman, nexp)]
 
-    value_i *= value_e
-    value_q *= value_e
+        if __unpack_numba_threadsafe():
+            kernel(*kernel_args)
+        else:
+            with __unpack_numba_lock:
+                kernel(*kernel_args)
+    else:
+        unpacked = __unpack_numpy(csi, nman, nexp)
 
-    unpacked = np.stack((value_i, value_q), axis=1).flatten().astype(np.float32).view(np.complex64)
+        if fftshift:
+            unpacked = unpacked.take(__subcarrier_order(nsub, True), axis=-1)
 
-    unpacked = unpacked.reshape(csi.shape)
-    unpacked = np.asmatrix(unpacked)
+    # A single sample is unpacked as a row
+    unpacked = np.atleast_2d(unpacked)
 
     if unpacked.shape[1] == 64:
         bandwidth = 20
@@ -270,13 +491,6 @@ def unpack(csi, device, fftshift=True, zero_nulls=False, zero_pilots=False):
     else:
         raise ValueError("Couldn't determine bandwidth. Is the packet corrupt? " +
             "Please create a new Issue: https://github.com/nexmonster/nexcsi/issues")
-    if (zero_nulls or zero_pilots) and not fftshift:
-        import warnings
-        warnings.warn("FFTshift is automatically enabled when dropping pilots or nulls. Set fftshift to True to silence this warning.")
-        fftshift = True
-    
-    if fftshift:
-        unpacked = np.fft.fftshift(unpacked, axes=(1,))
 
     if zero_nulls:
         unpacked[:, nulls[bandwidth]] = 0
@@ -296,4 +510,5 @@ def unpack(csi, device, fftshift=True, zero_nulls=False, zero_pilots=False):
         'zero_pilots': zero_nulls,
     })
 
-    return unpacked.astype(dt)
\ No newline at end of file
+    # Attaches the metadata without copying
+    return unpacked.view(dt)
\ No newline at end of file
@@ -9,7 +9,8 @@ Interleaved CSI samples in PCAP files.
 
 Suitable for bcm43455c0 and bcm4339 chips.
 
-Requires Numpy.
+Requires Numpy. Uses Numba, if it is
+installed, to read pcap files faster.
 
 Usage
 -----
@@ -22,14 +23,23 @@ Bandwidth is inferred from the pcap file, but
 can also be explicitly set:
 
 samples = interleaved.read_pcap('path_to_pcap_file', bandwidth=40)
+
+Many pcap files can be read in parallel:
+
+for samples in interleaved.read_pcaps(['a.pcap', 'b.pcap'], workers=4):
+    ...
 """
 
-__all__ = ["read_pcap", "unpack"]
+__all__ = ["read_pcap", "read_pcaps", "unpack"]
 
 import os
 import numpy as np
+from functools import lru_cache
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
-from nexcsi import nulls, pilots
+from nexcsi import nulls, pilots, complex32
+from nexcsi import _fastread
 
 def __find_bandwidth(incl_len):
     """
@@ -85,7 +95,42 @@ def __find_nsamples_max(pcap_filesize, nsub):
 
     return nsamples_max
 
-def read_pcap(pcap_filepath, bandwidth=None, nsamples_max=None):
+@lru_cache(maxsize=8)
+def __make_dtype_sample(bandwidth):
+    """
+    Returns the Numpy dtype of a sample,
+    without metadata.
+
+    Building a structured dtype is slow
+    compared to reading a small pcap file,
+    so dtypes are cached by bandwidth.
+    """
+
+    # Number of OFDM sub-carriers
+    nsub = int(bandwidth * 3.2)
+
+    return np.dtype(
+        [
+            ("ts_sec",  np.uint32),
+            ("ts_usec", np.uint32),
+            ("saddr", np.dtype(np.uint32).newbyteorder('>')),
+            ("daddr", np.dtype(np.uint32).newbyteorder('>')),
+            ("sport", np.dtype(np.uint16).newbyteorder('>')),
+            ("dport", np.dtype(np.uint16).newbyteorder('>')),
+            ("magic", np.uint16),
+            ("rssi", np.int8),
+            ("fctl", np.uint8),
+            ("mac", np.uint8, 6),
+            ("seq", np.uint16),
+            ("css", np.uint16),
+            ("csp", np.uint16),
+            ("cvr", np.uint16),
+            ("csi", np.int16, nsub * 2),
+        ]
+    )
+
+
+def read_pcap(pcap_filepath, bandwidth=None, nsamples_max=None, copy=True):
     """
     Reads CSI samples from
     a pcap file. A Numpy
@@ -94,12 +139,18 @@ def read_pcap(pcap_filepath, bandwidth=None, nsamples_max=None):
     Bandwidth and maximum samples
     are inferred from the pcap file by
     default, but you can also set them explicitly.
+
+    If copy is False and all packets in the
+    file have the same length, a read-only view
+    of the memory-mapped file is returned instead,
+    without copying any samples. Its fields are
+    the same, but they are not packed together.
     """
 
     pcap_filesize = os.stat(pcap_filepath).st_size
 
     with open(pcap_filepath, "rb") as pcapfile:
-        fc = pcapfile.read()  # ~2.68 s
+        fc = _fastread.map_pcap(pcapfile)
 
     if bandwidth is None:
         bandwidth = __find_bandwidth(
@@ -113,28 +164,17 @@ def read_pcap(pcap_filepath, bandwidth=None, nsamples_max=None):
     # Number of OFDM sub-carriers
     nsub = int(bandwidth * 3.2)
 
+    # The estimate of nsamples_max is too low if some
+    # packets are shorter than a CSI packet, so the
+    # output grows if it fills up before the end.
+    grow = nsamples_max is None
+
     if nsamples_max is None:
         nsamples_max = __find_nsamples_max(pcap_filesize, nsub)
 
     # Numpy dtype for sample: https://numpy.org/doc/stable/reference/arrays.dtypes.html
     dtype_sample = np.dtype(
-        [
-            ("ts_sec",  np.uint32),
-            ("ts_usec", np.uint32),
-            ("saddr", np.dtype(np.uint32).newbyteorder('>')),
-            ("daddr", np.dtype(np.uint32).newbyteorder('>')),
-            ("sport", np.dtype(np.uint16).newbyteorder('>')),
-            ("dport", np.dtype(np.uint16).newbyteorder('>')),
-            ("magic", np.uint16),
-            ("rssi", np.int8),
-            ("fctl", np.uint8),
-            ("mac", np.uint8, 6),
-            ("seq", np.uint16),
-            ("css", np.uint16),
-            ("csp", np.uint16),
-            ("cvr", np.uint16),
-            ("csi", np.int16, nsub * 2),
-        ],
+        __make_dtype_sample(bandwidth),
         # This wont be preserved during all array operations.
         # Be very cautious if you're accessing these values
         metadata={
@@ -145,51 +185,77 @@ def read_pcap(pcap_filepath, bandwidth=None, nsamples_max=None):
         }
     )
 
+    if not copy:
+        samples = _fastread.overlay(fc, dtype_sample)
+
+        if samples is not None:
+            return samples[:nsamples_max]
+
     # Number of bytes in a sample
     nbytes_sample = dtype_sample.itemsize
 
     # Pre-allocating memory to contain all samples
-    data = bytearray(nsamples_max * nbytes_sample)  # ~ 1.5s
+    samples = np.empty(nsamples_max, dtype=dtype_sample)
 
-    # This is to track our current position in the bytearray `data`
-    data_index = 0
+    data, nsamples = _fastread.walk(
+        fc, samples.view(np.uint8), nbytes_sample, grow=grow
+    )
 
-    # Pointer to current location in file.
-    # This is faster than using file.tell()
-    # =24 to skip pcap global header
-    ptr = 24
+    # data is a larger copy of samples if it grew
+    samples = data.view(dtype_sample)
 
-    nsamples = 0
-    while ptr < pcap_filesize:
+    return samples[:nsamples]
 
-        frame_len = int.from_bytes(  # ~ 3 s
-            fc[ptr + 8: ptr + 12], byteorder="little", signed=False
-        )
 
-        # Read Timestamps
-        data[data_index: data_index + 8] = fc[ptr: ptr + 8]
+def read_pcaps(pcap_filepaths, workers=None, **kwargs):
+    """
+    Reads CSI samples from many pcap
+    files in parallel threads, and yields
+    a Numpy Structured Array per file,
+    in the order of pcap_filepaths.
+
+    The walk over packets releases the GIL,
+    so files are read concurrently. Other
+    keyword arguments are passed to read_pcap.
+
+    At most `workers` files (os.cpu_count()
+    by default) are read ahead of the file
+    being yielded, so memory stays bounded.
+    """
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = deque()
 
-        # Read saddr, daddr, sport, dport
-        data[data_index + 8: data_index + 20] = fc[ptr + 42: ptr + 54]
+        for pcap_filepath in pcap_filepaths:
+            futures.append(executor.submit(read_pcap, pcap_filepath, **kwargs))
 
-        ptr += 58  # Skip over Header, Eth, IP, UDP
+            if len(futures) == workers:
+                yield futures.popleft().result()
 
-        data[data_index + 20: data_index + nbytes_sample] = fc[
-            ptr: ptr + nbytes_sample - 20
-        ]  # ~ 5.2 s
+        while futures:
+            yield futures.popleft().result()
 
-        nsamples += 1
-        ptr += frame_len - 42
-        data_index += nbytes_sample
 
-    samples = np.frombuffer(
-        data[:data_index], dtype=dtype_sample, count=nsamples
-    )  # ~ 1.8 s
+@lru_cache(maxsize=8)
+def __fftshift_order(nsub):
+    """
+    Returns the fftshifted indexes
+    of `nsub` subcarriers.
+
+    Cached by number of subcarriers, so
+    fftshift is a single take() per call.
+    """
+
+    order = np.fft.fftshift(np.arange(nsub))
+    order.flags.writeable = False
 
-    return samples
+    return order
 
 
-def unpack(csi, device, fftshift=True, zero_nulls=False, zero_pilots=False):
+def unpack(csi, device, fftshift=True, zero_nulls=False, zero_pilots=False, dtype=np.complex64):
     """
     Convert CSI samples from raw,
     in-packet format to Complex64s
@@ -201,10 +267,32 @@ def unpack(csi, device, fftshift=True, zero_nulls=False, zero_pilots=False):
     Set fftshift to False for some
     speedup if you don't care about the
     order of subcarriers.
+
+    Set dtype to "complex32" (or nexcsi.complex32)
+    to get pairs of float16s, which take half the
+    memory. float16 holds integers exactly up to
+    2048, so larger CSI values lose precision.
     """
+    if isinstance(dtype, str) and dtype == "complex32":
+        dtype = complex32
+
+    dtype = np.dtype(dtype)
+
+    if dtype != np.complex64 and dtype != complex32:
+        raise ValueError("dtype should be either np.complex64 or 'complex32'.")
+
+    if (zero_nulls or zero_pilots) and not fftshift:
+        import warnings
+        warnings.warn("FFTshift is automatically enabled when dropping pilots or nulls. Set fftshift to True to silence this warning.")
+        fftshift = True
+
     unpacked = csi.astype(np.float32).view(np.complex64)
 
-    unpacked = np.asmatrix(unpacked)
+    if fftshift:
+        unpacked = unpacked.take(__fftshift_order(unpacked.shape[-1]), axis=-1)
+
+    # A single sample is unpacked as a row
+    unpacked = np.atleast_2d(unpacked)
 
     if unpacked.shape[1] == 64:
         bandwidth = 20
@@ -218,20 +306,15 @@ def unpack(csi, device, fftshift=True, zero_nulls=False, zero_pilots=False):
         raise ValueError("Couldn't determine bandwidth. Is the packet corrupt? " +
             "Please create a new Issue: https://github.com/nexmonster/nexcsi/issues")
     
-    if (zero_nulls or zero_pilots) and not fftshift:
-        import warnings
-        warnings.warn("FFTshift is automatically enabled when dropping pilots or nulls. Set fftshift to True to silence this warning.")
-        fftshift = True
-
-    if fftshift:
-        unpacked = np.fft.fftshift(unpacked, axes=(1,))
-
     if zero_nulls:
         unpacked[:, nulls[bandwidth]] = 0
     
     if zero_pilots:
         unpacked[:, pilots[bandwidth]] = 0
 
+    if dtype == complex32:
+        unpacked = unpacked.view(np.float32).astype(np.float16).view(complex32)
+
     # This wont be preserved during all array operations.
     # Be very cautious if you're accessing these values
     dt = np.dtype(unpacked.dtype, metadata={
@@ -244,4 +327,5 @@ def unpack(csi, device, fftshift=True, zero_nulls=False, zero_pilots=False):
         'zero_pilots': zero_nulls,
     })
 
-    return unpacked.astype(dt)
\ No newline at end of file
+    # Attaches the metadata without copying
+    return unpacked.view(dt)
\ No newline at end of file
@@ -0,0 +1,71 @@
+import struct
+import numpy as np
+import pytest
+
+
+def make_pcap(nsub, nsamples, padding=(0,), truncate=0, short=None, seed=0):
+    """
+    Returns the bytes of a synthetic pcap file
+    of nexmon_csi packets with `nsub` subcarriers,
+    and the bytes of the samples in it, as
+    read_pcap copies them out.
+
+    The i-th packet is followed by padding[i % len(padding)]
+    zero bytes. If `truncate` is set, a packet cut short
+    by that many bytes is appended at the end. If `short`
+    is set to (i, length), a packet of `length` zero bytes,
+    which isn't a CSI packet, is inserted before the i-th.
+    """
+
+    rng = np.random.default_rng(seed)
+
+    # Timestamps, saddr/daddr/sport/dport, and nexmon
+    # metadata + CSI, in the order of the sample dtype
+    nbytes_sample = 8 + 12 + 18 + nsub * 4
+
+    pcap = [struct.pack("<IHHiIII", 0xA1B2C3D4, 2, 4, 0, 0, 65535, 1)]
+    samples = []
+
+    for i in range(nsamples + (truncate > 0)):
+        if short is not None and short[0] == i:
+            pcap.append(struct.pack("<IIII", 0, 0, short[1], short[1]))
+            pcap.append(bytes(short[1]))
+
+        sample = rng.integers(0, 256, nbytes_sample, dtype=np.uint8).tobytes()
+
+        payload = (
+            bytes(14)  # Ethernet
+            + bytes(12) + sample[8:20]  # IP, with saddr and daddr
+            + bytes(4)  # UDP, after sport and dport
+            + sample[20:]
+            + bytes(padding[i % len(padding)])
+        )
+
+        # Packet header: timestamps, incl_len and orig_len
+        pcap.append(sample[0:8] + struct.pack("<II", len(payload), len(payload)))
+
+        if i == nsamples:
+            pcap.append(payload[:-truncate])
+        else:
+            pcap.append(payload)
+            samples.append(sample)
+
+    return b"".join(pcap), b"".join(samples)
+
+
+@pytest.fixture
+def write_pcap(tmp_path):
+    """
+    Writes a synthetic pcap file with make_pcap,
+    and returns its path and the expected sample bytes.
+    """
+
+    def write(*args, name="capture.pcap", **kwargs):
+        pcap, samples = make_pcap(*args, **kwargs)
+
+        path = tmp_path / name
+        path.write_bytes(pcap)
+
+        return str(path), samples
+
+    return write
@@ -0,0 +1,47 @@
+from functools import partial
+
+import numpy as np
+import pytest
+
+from nexcsi import decoder, interleaved, floating
+from nexcsi._decoder import raspberrypi, nexus5, nexus6p, rtac86u
+
+
+devices = [
+    (interleaved, raspberrypi),
+    (interleaved, nexus5),
+    (floating, nexus6p),
+    (floating, rtac86u),
+]
+
+
+@pytest.mark.parametrize(
+    "module, names, name",
+    [(module, names, name) for module, names in devices for name in names],
+)
+def test_decoder(module, names, name):
+    decoded = decoder(name)
+
+    assert decoded is module
+    assert decoded.unpack.keywords == {"device": names[0]}
+
+
+def test_decoder_metadata():
+    csi = np.zeros((1, 128), dtype=np.int16)
+
+    # Aliases are reported by their canonical name
+    assert decoder("rpi").unpack(csi).dtype.metadata["device"] == "raspberrypi"
+
+
+def test_decoder_unknown_device():
+    with pytest.raises(ValueError):
+        decoder("nexus7")
+
+
+def test_decoder_repeated():
+    decoder("rpi")
+    module = decoder("nexus5")
+
+    # Partials of previous calls aren't nested
+    assert not isinstance(module.unpack.func, partial)
+    assert module.unpack.keywords == {"device": "nexus5"}
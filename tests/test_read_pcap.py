@@ -0,0 +1,155 @@
+import time
+import numpy as np
+import pytest
+
+from nexcsi import interleaved, floating
+from nexcsi import _fastread
+
+
+backends = ["numba", "c", "python"]
+
+
+def _walk(backend, monkeypatch):
+    """
+    Forces _fastread.walk to use `backend`.
+    """
+
+    if backend == "c" and _fastread.__dict__["__walk_c"] is None:
+        pytest.skip("The C extension isn't built")
+
+    if backend == "numba" and _fastread.njit is None:
+        pytest.skip("Numba isn't installed")
+
+    if backend != "numba":
+        monkeypatch.setattr(_fastread, "njit", None)
+
+    if backend != "c":
+        monkeypatch.setattr(_fastread, "__walk_c", None)
+
+
+captures = {
+    "regular": dict(nsamples=50),
+    "padded": dict(nsamples=50, padding=(0, 0, 2, 0, 6)),
+    "irregular": dict(nsamples=50, padding=(0, 128, 4)),
+    "truncated": dict(nsamples=50, truncate=100),
+    "truncated-header": dict(nsamples=50, truncate=1060),
+    "empty": dict(nsamples=0),
+}
+
+
+@pytest.mark.parametrize("window", [None, 1000, 4099])
+@pytest.mark.parametrize("backend", backends)
+@pytest.mark.parametrize("capture", captures)
+@pytest.mark.parametrize("module", [interleaved, floating])
+def test_read_pcap(module, capture, backend, window, write_pcap, monkeypatch):
+    _walk(backend, monkeypatch)
+
+    if window is not None:
+        # Windows smaller than a packet, and not a multiple of pages
+        monkeypatch.setattr(_fastread, "_WINDOW", window)
+
+    path, expected = write_pcap(256, **captures[capture])
+
+    samples = module.read_pcap(path, bandwidth=80)
+
+    assert samples.dtype.metadata["bandwidth"] == 80
+    assert samples.tobytes() == expected
+
+
+@pytest.mark.parametrize("backend", backends)
+@pytest.mark.parametrize("short", [(10, 100), (10, 0), (49, 100)])
+def test_read_pcap_short_packets(short, backend, write_pcap, monkeypatch):
+    _walk(backend, monkeypatch)
+
+    path, expected = write_pcap(256, nsamples=50, short=short)
+
+    samples = floating.read_pcap(path)
+
+    # The short packet is read as a sample too,
+    # and no CSI packet after it is dropped
+    assert len(samples) == 51
+    assert np.delete(samples, short[0]).tobytes() == expected
+
+
+@pytest.mark.parametrize("nsub, bandwidth", [(64, 20), (128, 40), (256, 80)])
+def test_find_bandwidth(nsub, bandwidth, write_pcap):
+    path, expected = write_pcap(nsub, nsamples=10, padding=(0, 2))
+
+    samples = floating.read_pcap(path)
+
+    assert samples.dtype.metadata["bandwidth"] == bandwidth
+    assert samples.tobytes() == expected
+
+
+def test_nsamples_max(write_pcap):
+    path, expected = write_pcap(256, nsamples=50, padding=(0, 2))
+
+    samples = interleaved.read_pcap(path, nsamples_max=20)
+
+    assert samples.tobytes() == expected[: 20 * samples.dtype.itemsize]
+
+
+@pytest.mark.parametrize("module", [interleaved, floating])
+def test_read_pcap_empty_file(module, tmp_path):
+    # e.g. a capture tcpdump has only just created
+    path = tmp_path / "capture.pcap"
+    path.write_bytes(b"")
+
+    samples = module.read_pcap(str(path), bandwidth=80)
+
+    assert len(samples) == 0
+    assert samples.dtype.metadata["bandwidth"] == 80
+
+
+@pytest.mark.parametrize("capture", [*captures, "short"])
+@pytest.mark.parametrize("module", [interleaved, floating])
+def test_read_pcap_no_copy(module, capture, write_pcap):
+    kwargs = captures.get(capture, dict(nsamples=50, short=(10, 100)))
+    path, _ = write_pcap(256, **kwargs)
+
+    copied = module.read_pcap(path, bandwidth=80)
+    samples = module.read_pcap(path, bandwidth=80, copy=False)
+
+    # Regular captures are a read-only view of the file
+    assert samples.flags.writeable != (capture == "regular")
+
+    assert samples.dtype.names == copied.dtype.names
+    assert samples.dtype.metadata == copied.dtype.metadata
+
+    for name in copied.dtype.names:
+        assert np.array_equal(samples[name], copied[name])
+
+
+def test_read_pcaps(write_pcap):
+    paths, expected = [], []
+    for i in range(5):
+        path, samples = write_pcap(256, nsamples=10 + i, seed=i, name=f"{i}.pcap")
+
+        paths.append(path)
+        expected.append(samples)
+
+    results = list(floating.read_pcaps(paths, workers=2))
+
+    assert [samples.tobytes() for samples in results] == expected
+
+
+def test_read_pcaps_bounded(monkeypatch):
+    started = []
+
+    def read_pcap(pcap_filepath):
+        started.append(pcap_filepath)
+        time.sleep(0.001)
+
+        return pcap_filepath
+
+    monkeypatch.setattr(floating, "read_pcap", read_pcap)
+
+    results = []
+    for result in floating.read_pcaps(range(20), workers=3):
+        # At most `workers` files are read ahead of a slow consumer
+        assert len(started) <= len(results) + 3
+
+        results.append(result)
+        time.sleep(0.005)
+
+    assert results == list(range(20))
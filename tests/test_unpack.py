@@ -0,0 +1,127 @@
+import numpy as np
+import pytest
+
+from nexcsi import decoder, floating, complex32
+
+
+def _csi(nsamples, nsub, seed=0):
+    rng = np.random.default_rng(seed)
+
+    return rng.integers(0, 1 << 32, (nsamples, nsub), dtype=np.uint64).astype(np.uint32)
+
+
+def _unpack_numpy(csi, device, monkeypatch, **kwargs):
+    """
+    Unpacks floating point CSI without Numba.
+    """
+
+    with monkeypatch.context() as m:
+        m.setattr(floating, "njit", None)
+
+        return decoder(device).unpack(csi, **kwargs)
+
+
+@pytest.mark.parametrize("device, nman, nexp", [("rtac86u", 12, 6), ("nexus6p", 9, 5)])
+def test_floating_values(device, nman, nexp, monkeypatch):
+    # I = 3, Q = -5, E = 2
+    value = 3 << (nexp + nman) | 1 << (nexp + nman - 1) | 5 << nexp | 2
+    csi = np.full((1, 64), value, dtype=np.uint32)
+
+    expected = np.full((1, 64), (3 - 5j) * 2 ** 12, dtype=np.complex64)
+
+    assert np.array_equal(decoder(device).unpack(csi), expected)
+    assert np.array_equal(_unpack_numpy(csi, device, monkeypatch), expected)
+
+
+@pytest.mark.filterwarnings("ignore:FFTshift is automatically enabled")
+@pytest.mark.parametrize("nulls_pilots", [(False, False), (True, False), (False, True), (True, True)])
+@pytest.mark.parametrize("fftshift", [True, False])
+@pytest.mark.parametrize("nsub", [64, 128, 256])
+@pytest.mark.parametrize("device", ["rtac86u", "nexus6p"])
+def test_floating_numba(device, nsub, fftshift, nulls_pilots, monkeypatch):
+    if floating.njit is None:
+        pytest.skip("Numba isn't installed")
+
+    zero_nulls, zero_pilots = nulls_pilots
+    kwargs = dict(fftshift=fftshift, zero_nulls=zero_nulls, zero_pilots=zero_pilots)
+
+    csi = _csi(100, nsub)
+
+    unpacked = decoder(device).unpack(csi, **kwargs)
+    expected = _unpack_numpy(csi, device, monkeypatch, **kwargs)
+
+    assert unpacked.dtype == np.complex64
+    assert unpacked.dtype.metadata == expected.dtype.metadata
+    assert np.array_equal(unpacked, expected)
+
+
+@pytest.mark.parametrize("dtype", [np.int64, np.uint64, ">u4"])
+@pytest.mark.parametrize("device", ["rtac86u", "nexus6p"])
+def test_floating_input_dtypes(device, dtype, monkeypatch):
+    csi = _csi(10, 256)
+
+    expected = decoder(device).unpack(csi)
+
+    assert np.array_equal(decoder(device).unpack(csi.astype(dtype)), expected)
+    assert np.array_equal(
+        _unpack_numpy(csi.astype(dtype), device, monkeypatch), expected
+    )
+
+
+def test_floating_sample(write_pcap):
+    path, _ = write_pcap(256, nsamples=10)
+
+    samples = floating.read_pcap(path)
+
+    unpacked = decoder("rtac86u").unpack(samples["csi"])
+    expected = decoder("rtac86u").unpack(samples["csi"].copy())
+
+    assert unpacked.shape == (10, 256)
+    assert np.array_equal(unpacked, expected)
+
+    # A single sample is unpacked as a row
+    assert np.array_equal(decoder("rtac86u").unpack(samples[0]["csi"]), expected[:1])
+
+
+@pytest.mark.parametrize("dtype", ["complex32", complex32])
+def test_floating_complex32(dtype):
+    with pytest.raises(ValueError):
+        decoder("rtac86u").unpack(_csi(10, 256), dtype=dtype)
+
+
+@pytest.mark.parametrize("fftshift", [True, False])
+@pytest.mark.parametrize("device", ["raspberrypi", "nexus5"])
+def test_interleaved(device, fftshift):
+    csi = np.random.default_rng(0).integers(-32768, 32768, (10, 512), dtype=np.int16)
+
+    expected = (csi[:, 0::2] + 1j * csi[:, 1::2]).astype(np.complex64)
+    if fftshift:
+        expected = np.fft.fftshift(expected, axes=-1)
+
+    unpacked = decoder(device).unpack(csi, fftshift=fftshift)
+
+    assert unpacked.dtype == np.complex64
+    assert unpacked.dtype.metadata["fftshift"] == fftshift
+    assert np.array_equal(unpacked, expected)
+
+
+@pytest.mark.parametrize("dtype", ["complex32", complex32])
+@pytest.mark.parametrize("device", ["raspberrypi", "nexus5"])
+def test_interleaved_complex32(device, dtype):
+    csi = np.random.default_rng(0).integers(-32768, 32768, (10, 512), dtype=np.int16)
+
+    expected = decoder(device).unpack(csi)
+    unpacked = decoder(device).unpack(csi, dtype=dtype)
+
+    assert unpacked.dtype == complex32
+    assert unpacked.dtype.metadata == expected.dtype.metadata
+
+    # Rounded to float16, but never inf for int16 CSI
+    assert np.array_equal(unpacked["real"], expected.real.astype(np.float16))
+    assert np.array_equal(unpacked["imag"], expected.imag.astype(np.float16))
+    assert np.isfinite(unpacked["real"]).all() and np.isfinite(unpacked["imag"]).all()
+
+
+def test_interleaved_dtype():
+    with pytest.raises(ValueError):
+        decoder("raspberrypi").unpack(np.zeros((1, 128), dtype=np.int16), dtype=np.float32)